@@ -1,6 +1,6 @@
 import os
 import requests
-from time import sleep
+from time import sleep, time
 
 from onedrive_item import OneDriveItem
 from onedrive_constants import OneDriveConstants
@@ -12,7 +12,6 @@ logger = SafeLogger("onedrive plugin", forbiden_keys=["onedrive_credentials"])
 
 class OneDriveClient():
     access_token = None
-    CHUNK_SIZE = 320 * 1024
     DRIVE_API_URL = "https://graph.microsoft.com/v1.0/me/drive/"
     ITEMS_API_URL = "https://graph.microsoft.com/v1.0/me/drive/items/"
     SHARED_API_URL = "https://graph.microsoft.com/v1.0/drives/{drive_id}/root:/{file_path}:"
@@ -38,19 +37,69 @@ class OneDriveClient():
         file_size = self.file_size(file_handle)
         file_handle.seek(0)
         next_expected_range_low = 0
-
-        while file_handle.tell() < file_size:
-            self.put(file_handle.read(self.CHUNK_SIZE), url, next_expected_range_low, file_size)
-            next_expected_range_low = next_expected_range_low + self.CHUNK_SIZE
+        fragment_size = get_initial_fragment_size(file_size)
+        number_retries = OneDriveConstants.NB_RETRIES_ON_UPLOAD_FRAGMENT_TIMEOUT
+        logger.info("upload_loop:file_size={}, initial fragment_size={}".format(file_size, fragment_size))
+
+        timed_out_range_high = None
+
+        while next_expected_range_low < file_size:
+            try:
+                if timed_out_range_high is not None:
+                    # The fragment may have been stored before the timeout, so the upload resumes where the server stands
+                    next_expected_range_low = self.get_next_expected_range_low(url, timed_out_range_high, file_size)
+                    timed_out_range_high = None
+                    logger.info("Resuming upload at offset {} with fragment_size={}".format(next_expected_range_low, fragment_size))
+                    continue
+                file_handle.seek(next_expected_range_low)
+                data = file_handle.read(fragment_size)
+                start_time = time()
+                response = self.put(data, url, next_expected_range_low, file_size)
+            except requests.exceptions.Timeout as error:
+                if timed_out_range_high is None:
+                    timed_out_range_high = next_expected_range_low + len(data)
+                if fragment_size > OneDriveConstants.UPLOAD_FRAGMENT_UNIT:
+                    # Retries are only spent once the fragment can not shrink any more
+                    fragment_size = get_shrunk_fragment_size(fragment_size)
+                elif number_retries:
+                    number_retries -= 1
+                else:
+                    raise Exception("Timeout while uploading fragment at offset {}".format(next_expected_range_low)) from error
+                logger.warning("Timeout on upload at offset {}, fragment_size set to {}".format(
+                    next_expected_range_low, fragment_size
+                ))
+                continue
+            assert_response_ok(response, context="uploading fragment at offset {}".format(next_expected_range_low))
+            duration = time() - start_time
+            next_expected_range_low = next_expected_range_low + len(data)
+            number_retries = OneDriveConstants.NB_RETRIES_ON_UPLOAD_FRAGMENT_TIMEOUT
+            next_fragment_size = get_next_fragment_size(fragment_size, len(data), duration)
+            if next_fragment_size != fragment_size:
+                logger.info("Fragment of {} bytes uploaded in {:.2f}s, fragment_size set to {}".format(
+                    len(data), duration, next_fragment_size
+                ))
+            fragment_size = next_fragment_size
 
     def put(self, data, url, next_expected_range_low, file_size):
         headers = {
             "Content-Length": "{}".format(len(data)),
             "Content-Range": "bytes {}-{}/{}".format(next_expected_range_low, next_expected_range_low + len(data) - 1, file_size)
         }
-        response = self.session.put(url, headers=headers, data=data)
+        response = self.session.put(url, headers=headers, data=data, timeout=OneDriveConstants.UPLOAD_FRAGMENT_TIMEOUT)
         return response
 
+    def get_next_expected_range_low(self, url, range_high, file_size):
+        response = self.session.get(url, timeout=OneDriveConstants.UPLOAD_FRAGMENT_TIMEOUT)
+        if response.status_code == 404 and range_high == file_size:
+            # The session is closed once the last fragment is stored
+            logger.info("Upload session closed, last fragment was received")
+            return file_size
+        assert_response_ok(response, context="getting upload session status")
+        next_expected_ranges = response.json().get(OneDriveConstants.NEXT_EXPECTED_RANGES, [])
+        if not next_expected_ranges:
+            return file_size
+        return int(next_expected_ranges[0].split("-")[0])
+
     def file_size(self, file_handle):
         file_handle.seek(0, 2)
         return file_handle.tell()
@@ -236,6 +285,34 @@ def assert_response_ok(response, context=None, can_raise=True):
     return error_message
 
 
+def round_fragment_size(size):
+    # Fragments must be a multiple of 320 KiB and stay below the Graph maximum
+    size = (int(size) // OneDriveConstants.UPLOAD_FRAGMENT_UNIT) * OneDriveConstants.UPLOAD_FRAGMENT_UNIT
+    return min(max(size, OneDriveConstants.UPLOAD_FRAGMENT_UNIT), OneDriveConstants.MAX_UPLOAD_FRAGMENT_SIZE)
+
+
+def get_initial_fragment_size(file_size):
+    size = file_size // OneDriveConstants.TARGET_NB_UPLOAD_FRAGMENTS
+    return round_fragment_size(min(size, OneDriveConstants.MAX_INITIAL_UPLOAD_FRAGMENT_SIZE))
+
+
+def get_next_fragment_size(fragment_size, uploaded_size, duration):
+    if uploaded_size < fragment_size:
+        # Last, partial fragment: nothing to learn from it
+        return fragment_size
+    if duration <= 0:
+        return round_fragment_size(2 * fragment_size)
+    throughput = uploaded_size / duration
+    target_size = throughput * OneDriveConstants.TARGET_UPLOAD_FRAGMENT_DURATION
+    # Move progressively towards the size matching the target duration
+    target_size = min(max(target_size, fragment_size / 2), 2 * fragment_size)
+    return round_fragment_size(target_size)
+
+
+def get_shrunk_fragment_size(fragment_size):
+    return round_fragment_size(fragment_size / 2)
+
+
 def get_next_page_url(json_response):
     next_page_url = json_response.get(OneDriveConstants.NEXT_URL_KEY)
     if next_page_url:
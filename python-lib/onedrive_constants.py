@@ -6,12 +6,20 @@ class OneDriveConstants(object):
     ID = "id"
     ITEM = "item"
     LAST_MODIFIED = "lastModifiedDateTime"
+    MAX_UPLOAD_FRAGMENT_SIZE = 191 * 320 * 1024  # Graph rejects fragments of 60 MiB or more
+    MAX_INITIAL_UPLOAD_FRAGMENT_SIZE = 32 * 320 * 1024  # 10 MiB, upper bound recommended by Microsoft
     NAME = "name"
     NB_RETRIES_ON_CREATE_UPLOAD_SESSION = 2
+    NB_RETRIES_ON_UPLOAD_FRAGMENT_TIMEOUT = 3
+    NEXT_EXPECTED_RANGES = "nextExpectedRanges"
     NEXT_URL_KEY = "@odata.nextLink"
     ROOT = "root"
     SIZE = "size"
     TIME_BEFORE_RETRIES = 1
     TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+    TARGET_NB_UPLOAD_FRAGMENTS = 100
+    TARGET_UPLOAD_FRAGMENT_DURATION = 5
+    UPLOAD_FRAGMENT_TIMEOUT = 60
+    UPLOAD_FRAGMENT_UNIT = 320 * 1024  # Graph requires fragment sizes to be a multiple of 320 KiB
     UPLOAD_URL = "uploadUrl"
     VALUE_CONTAINER = "value"
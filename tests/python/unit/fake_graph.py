@@ -0,0 +1,249 @@
+import io
+import json
+import re
+import requests
+
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib.parse import urlparse, unquote
+
+
+GRAPH_HOST = "graph.microsoft.com"
+UPLOAD_URL = "https://upload.fake-graph.test/sessions/{}"
+DOWNLOAD_URL = "https://download.fake-graph.test/content/{}"
+LAST_MODIFIED = "2024-01-01T00:00:00Z"
+GRAPH_PATH_PATTERN = re.compile(r"^/v1\.0/me/drive/(?:items/)?root(?::(?P<path>.*?):)?(?:/(?P<command>\w+))?$")
+CONTENT_RANGE_PATTERN = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+def normalize_path(path):
+    elements = [element for element in (path or "").split("/") if element]
+    return "/" + "/".join(elements)
+
+
+class FakeGraphAdapter(BaseAdapter):
+    """
+    In-memory stand-in for the part of the Microsoft Graph drive API used by the plugin.
+    Every request going through the mounted session is recorded with its body and response sizes.
+    """
+    def __init__(self, page_size=200, dropped_puts=None, stored_timed_out_puts=None, timed_out_status_gets=None):
+        super(FakeGraphAdapter, self).__init__()
+        self.page_size = page_size
+        # Indexes of the fragment PUTs which time out before, or after, the fragment is stored
+        self.dropped_puts = dropped_puts or []
+        self.stored_timed_out_puts = stored_timed_out_puts or []
+        # Indexes of the upload session status GETs which time out
+        self.timed_out_status_gets = timed_out_status_gets or []
+        self.put_count = 0
+        self.status_get_count = 0
+        self.items = {}
+        self.upload_sessions = {}
+        self.next_id = 0
+        self.requests = []
+        self.add_folder("/")
+
+    # tree setup
+    def add_folder(self, path):
+        path = normalize_path(path)
+        if path in self.items:
+            return
+        if path != "/":
+            self.add_folder(path.rsplit("/", 1)[0])
+        self.items[path] = {"id": self.generate_id(), "content": None}
+
+    def add_file(self, path, content):
+        path = normalize_path(path)
+        self.add_folder(path.rsplit("/", 1)[0])
+        self.items[path] = {"id": self.generate_id(), "content": content}
+
+    def generate_id(self):
+        self.next_id += 1
+        return "ITEM{}".format(self.next_id)
+
+    def get_children_paths(self, path):
+        prefix = path.rstrip("/") + "/"
+        return sorted(
+            item_path for item_path in self.items
+            if item_path.startswith(prefix) and "/" not in item_path[len(prefix):]
+        )
+
+    # accounting
+    def reset_counters(self):
+        self.requests = []
+
+    def get_request_count(self):
+        return len(self.requests)
+
+    def get_bytes_sent(self):
+        return sum(request["bytes_sent"] for request in self.requests)
+
+    def get_bytes_received(self):
+        return sum(request["bytes_received"] for request in self.requests)
+
+    def get_content_ranges(self):
+        return [request["content_range"] for request in self.requests if request["method"] == "PUT"]
+
+    # transport
+    def send(self, request, **kwargs):
+        is_dropped, is_timed_out = self.get_timeout_mode(request)
+        response = None if is_dropped else self.dispatch(request)
+        self.requests.append({
+            "method": request.method,
+            "url": request.url,
+            "content_range": request.headers.get("Content-Range"),
+            "bytes_sent": len(request.body or b""),
+            "bytes_received": len(response.content) if response is not None else 0
+        })
+        if is_dropped or is_timed_out:
+            raise requests.exceptions.ReadTimeout(request=request)
+        return response
+
+    def get_timeout_mode(self, request):
+        if request.method == "PUT":
+            put_index = self.put_count
+            self.put_count += 1
+            return put_index in self.dropped_puts, put_index in self.stored_timed_out_puts
+        if request.method == "GET" and urlparse(request.url).netloc == urlparse(UPLOAD_URL).netloc:
+            status_get_index = self.status_get_count
+            self.status_get_count += 1
+            return status_get_index in self.timed_out_status_gets, False
+        return False, False
+
+    def close(self):
+        pass
+
+    def dispatch(self, request):
+        url = urlparse(request.url)
+        if url.netloc == urlparse(UPLOAD_URL).netloc:
+            session_id = url.path.rsplit("/", 1)[-1]
+            if request.method == "GET":
+                return self.get_upload_session(request, session_id)
+            return self.put_fragment(request, session_id)
+        if url.netloc == urlparse(DOWNLOAD_URL).netloc:
+            return self.download(request, unquote(url.path[len("/content"):]))
+        match = GRAPH_PATH_PATTERN.match(url.path) if url.netloc == GRAPH_HOST else None
+        if not match:
+            return self.build_error(request, 400, "invalidRequest")
+        path = normalize_path(unquote(match.group("path") or ""))
+        command = match.group("command")
+        handler = {
+            ("GET", None): self.get_item,
+            ("GET", "children"): self.get_children,
+            ("GET", "content"): self.get_content,
+            ("POST", "createUploadSession"): self.create_upload_session,
+            ("PATCH", None): self.patch_item,
+            ("DELETE", None): self.delete_item
+        }.get((request.method, command))
+        if handler is None:
+            return self.build_error(request, 400, "invalidRequest")
+        if path not in self.items and handler != self.create_upload_session:
+            return self.build_error(request, 404, "itemNotFound")
+        return handler(request, path, url)
+
+    def get_item(self, request, path, url):
+        return self.build_response(request, 200, self.describe(path, with_context=True))
+
+    def get_children(self, request, path, url):
+        skip = int(dict(parameter.split("=") for parameter in url.query.split("&") if parameter).get("skip", 0))
+        children_paths = self.get_children_paths(path)
+        body = {"value": [self.describe(child_path) for child_path in children_paths[skip:skip + self.page_size]]}
+        if skip + self.page_size < len(children_paths):
+            body["@odata.nextLink"] = "{}://{}{}?skip={}".format(url.scheme, url.netloc, url.path, skip + self.page_size)
+        return self.build_response(request, 200, body)
+
+    def get_content(self, request, path, url):
+        # Graph answers with a redirection to a pre-authenticated download URL
+        response = self.build_response(request, 302, b"")
+        response.headers["Location"] = DOWNLOAD_URL.format(path)
+        return response
+
+    def download(self, request, path):
+        item = self.items.get(normalize_path(path))
+        if item is None or item["content"] is None:
+            return self.build_error(request, 404, "itemNotFound")
+        return self.build_response(request, 200, item["content"])
+
+    def create_upload_session(self, request, path, url):
+        session_id = str(len(self.upload_sessions) + 1)
+        self.upload_sessions[session_id] = {"path": path, "content": b""}
+        return self.build_response(request, 200, {"uploadUrl": UPLOAD_URL.format(session_id)})
+
+    def get_upload_session(self, request, session_id):
+        upload_session = self.upload_sessions.get(session_id)
+        if upload_session is None:
+            return self.build_error(request, 404, "itemNotFound")
+        return self.build_response(request, 200, {"nextExpectedRanges": ["{}-".format(len(upload_session["content"]))]})
+
+    def put_fragment(self, request, session_id):
+        upload_session = self.upload_sessions.get(session_id)
+        if upload_session is None:
+            return self.build_error(request, 404, "itemNotFound")
+        content_range = CONTENT_RANGE_PATTERN.match(request.headers.get("Content-Range", ""))
+        if not content_range:
+            return self.build_error(request, 400, "invalidRange")
+        low, high, total = (int(value) for value in content_range.groups())
+        if low != len(upload_session["content"]) or high - low + 1 != len(request.body):
+            return self.build_error(request, 416, "invalidRange")
+        upload_session["content"] += request.body
+        if len(upload_session["content"]) < total:
+            return self.build_response(request, 202, {"nextExpectedRanges": ["{}-".format(high + 1)]})
+        self.add_file(upload_session["path"], upload_session["content"])
+        del self.upload_sessions[session_id]
+        return self.build_response(request, 201, self.describe(upload_session["path"]))
+
+    def patch_item(self, request, path, url):
+        body = json.loads(request.body)
+        parent_path = path.rsplit("/", 1)[0] or "/"
+        parent_id = body.get("parentReference", {}).get("id")
+        if parent_id:
+            parent_path = next(
+                (item_path for item_path, item in self.items.items() if item["id"] == parent_id),
+                None
+            )
+            if parent_path is None:
+                return self.build_error(request, 404, "itemNotFound")
+        new_path = normalize_path(parent_path + "/" + body.get("name", path.rsplit("/", 1)[-1]))
+        for item_path in sorted(self.items):
+            if item_path == path or item_path.startswith(path + "/"):
+                self.items[new_path + item_path[len(path):]] = self.items.pop(item_path)
+        return self.build_response(request, 200, self.describe(new_path))
+
+    def delete_item(self, request, path, url):
+        for item_path in list(self.items):
+            if item_path == path or item_path.startswith(path + "/"):
+                del self.items[item_path]
+        return self.build_response(request, 204, b"")
+
+    # responses
+    def describe(self, path, with_context=False):
+        item = self.items[path]
+        description = {
+            "id": item["id"],
+            "name": path.rsplit("/", 1)[-1] or "root",
+            "lastModifiedDateTime": LAST_MODIFIED
+        }
+        if with_context:
+            description["@odata.context"] = "https://{}/v1.0/$metadata#driveItem".format(GRAPH_HOST)
+        if item["content"] is None:
+            description["size"] = 0
+            description["folder"] = {"childCount": len(self.get_children_paths(path))}
+        else:
+            description["size"] = len(item["content"])
+            description["file"] = {}
+        return description
+
+    def build_error(self, request, status_code, code):
+        return self.build_response(request, status_code, {"error": {"code": code, "message": code}})
+
+    def build_response(self, request, status_code, body):
+        response = requests.Response()
+        if not isinstance(body, bytes):
+            body = json.dumps(body, sort_keys=True).encode("utf-8")
+        response.status_code = status_code
+        response._content = body
+        response.raw = io.BytesIO(body)
+        response.headers = CaseInsensitiveDict({"Content-Type": "application/json"})
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
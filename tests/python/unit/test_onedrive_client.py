@@ -0,0 +1,151 @@
+import io
+import pytest
+import requests
+
+import onedrive_client
+from fake_graph import FakeGraphAdapter
+from onedrive_client import OneDriveClient, get_initial_fragment_size, get_next_fragment_size, get_shrunk_fragment_size, round_fragment_size
+from onedrive_constants import OneDriveConstants
+
+
+UNIT = OneDriveConstants.UPLOAD_FRAGMENT_UNIT
+
+
+class TestFragmentSizing:
+    def test_round_fragment_size_is_multiple_of_unit(self):
+        assert round_fragment_size(3 * UNIT + 12) == 3 * UNIT
+
+    def test_round_fragment_size_bounds(self):
+        assert round_fragment_size(0) == UNIT
+        assert round_fragment_size(10 * OneDriveConstants.MAX_UPLOAD_FRAGMENT_SIZE) == OneDriveConstants.MAX_UPLOAD_FRAGMENT_SIZE
+        assert OneDriveConstants.MAX_UPLOAD_FRAGMENT_SIZE < 60 * 1024 * 1024
+
+    def test_initial_fragment_size_small_file(self):
+        assert get_initial_fragment_size(1024) == UNIT
+
+    def test_initial_fragment_size_large_file(self):
+        assert get_initial_fragment_size(1024 * 1024 * 1024) == OneDriveConstants.MAX_INITIAL_UPLOAD_FRAGMENT_SIZE
+
+    def test_next_fragment_size_grows_on_fast_link(self):
+        assert get_next_fragment_size(4 * UNIT, 4 * UNIT, 0.1) == 8 * UNIT
+
+    def test_next_fragment_size_shrinks_on_slow_link(self):
+        assert get_next_fragment_size(4 * UNIT, 4 * UNIT, 100) == 2 * UNIT
+
+    def test_next_fragment_size_kept_on_last_fragment(self):
+        assert get_next_fragment_size(4 * UNIT, UNIT, 0.1) == 4 * UNIT
+
+    def test_shrunk_fragment_size(self):
+        assert get_shrunk_fragment_size(8 * UNIT) == 4 * UNIT
+        assert get_shrunk_fragment_size(UNIT) == UNIT
+
+
+class TestUploadLoop:
+    def setup_method(self):
+        self.client = OneDriveClient("token")
+        self.content = bytes(bytearray(index % 251 for index in range(5 * UNIT + 7)))
+
+    def upload(self, graph, monkeypatch, initial_fragment_size=2 * UNIT, duration=OneDriveConstants.TARGET_UPLOAD_FRAGMENT_DURATION):
+        # Fragments taking the target duration keep their size, a 0.1 s one doubles it
+        clock = iter(float(index) * duration for index in range(1000))
+        monkeypatch.setattr(onedrive_client, "time", lambda: next(clock))
+        monkeypatch.setattr(onedrive_client, "get_initial_fragment_size", lambda file_size: initial_fragment_size)
+        self.client.session.mount("https://", graph)
+        upload_url = self.client.create_upload_session("/upload.bin")
+        self.client.upload_loop(io.BytesIO(self.content), upload_url)
+
+    def get_uploaded_content(self, graph):
+        return graph.items["/upload.bin"]["content"]
+
+    def test_upload_loop_grows_fragments(self, monkeypatch):
+        graph = FakeGraphAdapter()
+        self.upload(graph, monkeypatch, duration=0.1)
+        assert graph.get_content_ranges() == [
+            "bytes 0-655359/1638407",
+            "bytes 655360-1638406/1638407"
+        ]
+        assert self.get_uploaded_content(graph) == self.content
+
+    def test_upload_loop_retries_dropped_fragment_with_smaller_size(self, monkeypatch):
+        graph = FakeGraphAdapter(dropped_puts=[1])
+        self.upload(graph, monkeypatch)
+        assert graph.get_content_ranges() == [
+            "bytes 0-655359/1638407",
+            "bytes 655360-1310719/1638407",
+            "bytes 655360-983039/1638407",
+            "bytes 983040-1310719/1638407",
+            "bytes 1310720-1638399/1638407",
+            "bytes 1638400-1638406/1638407"
+        ]
+        assert self.get_uploaded_content(graph) == self.content
+
+    def test_upload_loop_resumes_after_stored_timed_out_fragment(self, monkeypatch):
+        graph = FakeGraphAdapter(stored_timed_out_puts=[1])
+        self.upload(graph, monkeypatch)
+        assert graph.get_content_ranges() == [
+            "bytes 0-655359/1638407",
+            "bytes 655360-1310719/1638407",
+            "bytes 1310720-1638399/1638407",
+            "bytes 1638400-1638406/1638407"
+        ]
+        assert self.get_uploaded_content(graph) == self.content
+
+    def test_upload_loop_stored_timed_out_last_fragment(self, monkeypatch):
+        graph = FakeGraphAdapter(stored_timed_out_puts=[2])
+        self.upload(graph, monkeypatch)
+        assert len(graph.get_content_ranges()) == 3
+        assert self.get_uploaded_content(graph) == self.content
+
+    def test_upload_loop_retries_timed_out_status_request(self, monkeypatch):
+        graph = FakeGraphAdapter(dropped_puts=[0], timed_out_status_gets=[0])
+        self.upload(graph, monkeypatch)
+        assert [request["method"] for request in graph.requests if request["method"] != "POST"] == [
+            "PUT", "GET", "GET", "PUT", "PUT", "PUT", "PUT", "PUT", "PUT"
+        ]
+        assert graph.get_content_ranges()[1] == "bytes 0-327679/1638407"
+        assert self.get_uploaded_content(graph) == self.content
+
+    def test_upload_loop_shrinks_slow_first_fragment_without_spending_retries(self, monkeypatch):
+        # On a slow link, every fragment above the minimal size times out
+        initial_fragment_size = OneDriveConstants.MAX_INITIAL_UPLOAD_FRAGMENT_SIZE
+        self.content = b"\1" * (initial_fragment_size + 7)
+        graph = FakeGraphAdapter(dropped_puts=[0, 1, 2, 3, 4])
+        self.upload(graph, monkeypatch, initial_fragment_size=initial_fragment_size)
+        assert graph.get_content_ranges()[:6] == [
+            "bytes 0-10485759/10485767",
+            "bytes 0-5242879/10485767",
+            "bytes 0-2621439/10485767",
+            "bytes 0-1310719/10485767",
+            "bytes 0-655359/10485767",
+            "bytes 0-327679/10485767"
+        ]
+        assert self.get_uploaded_content(graph) == self.content
+
+    def test_upload_loop_raises_when_retries_are_exhausted(self, monkeypatch):
+        retries = OneDriveConstants.NB_RETRIES_ON_UPLOAD_FRAGMENT_TIMEOUT
+        graph = FakeGraphAdapter(dropped_puts=list(range(retries + 1)))
+        with pytest.raises(Exception, match="Timeout while uploading fragment at offset 0") as error:
+            self.upload(graph, monkeypatch, initial_fragment_size=UNIT)
+        assert isinstance(error.value.__cause__, requests.exceptions.Timeout)
+        assert len(graph.get_content_ranges()) == retries + 1
+
+    def test_upload_loop_raises_when_status_requests_time_out(self, monkeypatch):
+        retries = OneDriveConstants.NB_RETRIES_ON_UPLOAD_FRAGMENT_TIMEOUT
+        graph = FakeGraphAdapter(dropped_puts=[0], timed_out_status_gets=list(range(retries)))
+        with pytest.raises(Exception, match="Timeout while uploading fragment at offset 0") as error:
+            self.upload(graph, monkeypatch, initial_fragment_size=UNIT)
+        assert isinstance(error.value.__cause__, requests.exceptions.Timeout)
+        assert len(graph.get_content_ranges()) == 1
+
+    def test_upload_loop_raises_on_rejected_fragment(self, monkeypatch):
+        graph = FakeGraphAdapter()
+        create_upload_session = graph.create_upload_session
+
+        def create_corrupted_upload_session(request, path, url):
+            response = create_upload_session(request, path, url)
+            for upload_session in graph.upload_sessions.values():
+                upload_session["content"] = b"unexpected"
+            return response
+        graph.create_upload_session = create_corrupted_upload_session
+        with pytest.raises(Exception, match="Error 416"):
+            self.upload(graph, monkeypatch)
@@ -0,0 +1,172 @@
+"""
+Number of HTTP requests and body bytes exchanged by each fs provider operation, checked against request_budgets.json.
+After an intended change in these numbers, regenerate the budgets with:
+    UPDATE_REQUEST_BUDGETS=1 PYTHONPATH=python-lib pytest tests/python/unit/test_request_budgets.py
+"""
+import importlib.util
+import io
+import json
+import os
+import sys
+import types
+import pytest
+
+from fake_graph import FakeGraphAdapter
+import onedrive_client
+
+try:
+    import dataiku.fsprovider  # noqa: F401
+except ImportError:
+    # The dataiku package only ships with DSS, the provider just needs its FSProvider base class
+    dataiku_module = types.ModuleType("dataiku")
+    fsprovider_module = types.ModuleType("dataiku.fsprovider")
+    fsprovider_module.FSProvider = type("FSProvider", (object,), {})
+    dataiku_module.fsprovider = fsprovider_module
+    sys.modules["dataiku"] = dataiku_module
+    sys.modules["dataiku.fsprovider"] = fsprovider_module
+
+
+TESTS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+FS_PROVIDER_PATH = os.path.join(TESTS_DIRECTORY, "../../../python-fs-providers/onedrive_onedrive-fs/fs-provider.py")
+BUDGETS_PATH = os.path.join(TESTS_DIRECTORY, "request_budgets.json")
+UPDATE_BUDGETS = os.environ.get("UPDATE_REQUEST_BUDGETS") == "1"
+
+
+def load_fs_provider_class():
+    spec = importlib.util.spec_from_file_location("onedrive_fs_provider", FS_PROVIDER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.OneDriveFSProvider
+
+
+def load_budgets():
+    with open(BUDGETS_PATH) as budgets_file:
+        return json.load(budgets_file)
+
+
+def save_budget(scenario, usage):
+    # Budgets of renamed or removed scenarios are dropped
+    budgets = {name: budget for name, budget in load_budgets().items() if name in SCENARIOS}
+    budgets[scenario] = usage
+    with open(BUDGETS_PATH, "w") as budgets_file:
+        json.dump(budgets, budgets_file, indent=4, sort_keys=True)
+        budgets_file.write("\n")
+
+
+class FakeClock(object):
+    # Uploads adapt their fragment size to the measured duration, so time is made deterministic
+    def __init__(self, step):
+        self.now = 0
+        self.step = step
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+def populate(graph):
+    graph.add_file("/data/file.csv", b"a,b\n1,2\n")
+    graph.add_file("/data/sub/nested.csv", b"c,d\n3,4\n")
+    graph.add_folder("/data/empty")
+    graph.add_folder("/target")
+    for index in range(450):
+        graph.add_file("/large/file_{:03d}.csv".format(index), b"x")
+
+
+# Scenarios whose graph answers the given fragment PUTs with a timeout after storing them
+STORED_TIMED_OUT_PUTS = {
+    "write_large_file_with_timed_out_fragment": [1]
+}
+
+SCENARIOS = {
+    "stat_file": lambda provider: provider.stat("/data/file.csv"),
+    "stat_directory": lambda provider: provider.stat("/data"),
+    "stat_missing": lambda provider: provider.stat("/missing.csv"),
+    "browse_file": lambda provider: provider.browse("/data/file.csv"),
+    "browse_directory": lambda provider: provider.browse("/data"),
+    "browse_large_directory": lambda provider: provider.browse("/large"),
+    "enumerate_file": lambda provider: provider.enumerate("/data/file.csv", False),
+    "enumerate_tree": lambda provider: provider.enumerate("/data", False),
+    "enumerate_first_non_empty": lambda provider: provider.enumerate("/data", True),
+    "read": lambda provider: provider.read("/data/file.csv", io.BytesIO(), None),
+    "write_small_file": lambda provider: provider.write("/new.csv", io.BytesIO(b"e,f\n5,6\n")),
+    "write_large_file": lambda provider: provider.write("/new.bin", io.BytesIO(b"\0" * 5 * 1024 * 1024)),
+    "write_large_file_with_timed_out_fragment": lambda provider: provider.write("/new.bin", io.BytesIO(b"\0" * 5 * 1024 * 1024)),
+    "move": lambda provider: provider.move("/data/file.csv", "/target/file.csv"),
+    "rename": lambda provider: provider.move("/data/file.csv", "/data/renamed.csv"),
+    "delete_recursive": lambda provider: provider.delete_recursive("/data")
+}
+
+
+class TestRequestBudgets:
+    def setup_class(self):
+        self.fs_provider_class = load_fs_provider_class()
+        self.budgets = load_budgets()
+
+    def build_provider(self, stored_timed_out_puts=None):
+        config = {"onedrive_connection": {"onedrive_credentials": "token"}}
+        provider = self.fs_provider_class("", config, {})
+        graph = FakeGraphAdapter(stored_timed_out_puts=stored_timed_out_puts)
+        populate(graph)
+        provider.client.session.mount("https://", graph)
+        return provider, graph
+
+    def test_every_scenario_has_a_budget(self):
+        if UPDATE_BUDGETS:
+            pytest.skip("Budgets are being regenerated")
+        assert sorted(self.budgets) == sorted(SCENARIOS)
+
+    @pytest.mark.parametrize("scenario", sorted(SCENARIOS))
+    def test_request_budget(self, scenario, monkeypatch):
+        monkeypatch.setattr(onedrive_client, "time", FakeClock(step=0.1))
+        provider, graph = self.build_provider(stored_timed_out_puts=STORED_TIMED_OUT_PUTS.get(scenario))
+        SCENARIOS[scenario](provider)
+        usage = {
+            "requests": graph.get_request_count(),
+            "bytes_sent": graph.get_bytes_sent(),
+            "bytes_received": graph.get_bytes_received()
+        }
+        if UPDATE_BUDGETS:
+            save_budget(scenario, usage)
+            return
+        assert usage == self.budgets.get(scenario), "Usage for {} changed, requests made: {}. Set UPDATE_REQUEST_BUDGETS=1 to regenerate the budgets".format(
+            scenario,
+            ["{} {}".format(request["method"], request["url"]) for request in graph.requests]
+        )
+
+    def test_write_then_read(self):
+        provider, graph = self.build_provider()
+        content = b"\1" * (700 * 1024)
+        provider.write("/round_trip.bin", io.BytesIO(content))
+        stream = io.BytesIO()
+        provider.read("/round_trip.bin", stream, None)
+        assert stream.getvalue() == content
+
+    def test_write_with_timed_out_fragment_then_stat(self):
+        provider, graph = self.build_provider(stored_timed_out_puts=[1])
+        content = b"\1" * (5 * 1024 * 1024)
+        provider.write("/timed_out.bin", io.BytesIO(content))
+        assert provider.stat("/timed_out.bin")["size"] == len(content)
+        stream = io.BytesIO()
+        provider.read("/timed_out.bin", stream, None)
+        assert stream.getvalue() == content
+
+    def test_write_with_rejected_fragment_fails(self):
+        provider, graph = self.build_provider()
+        create_upload_session = graph.create_upload_session
+
+        def create_corrupted_upload_session(request, path, url):
+            response = create_upload_session(request, path, url)
+            for upload_session in graph.upload_sessions.values():
+                upload_session["content"] = b"unexpected"
+            return response
+        graph.create_upload_session = create_corrupted_upload_session
+        with pytest.raises(Exception, match="Error 416"):
+            provider.write("/rejected.bin", io.BytesIO(b"e,f\n5,6\n"))
+        assert provider.stat("/rejected.bin") is None
+
+    def test_move_then_stat(self):
+        provider, graph = self.build_provider()
+        assert provider.move("/data/file.csv", "/target/file.csv")
+        assert provider.stat("/data/file.csv") is None
+        assert provider.stat("/target/file.csv")["size"] == 8